@@ -0,0 +1,42 @@
+"""Compare the matrix engines against the original triple loop.
+
+    python bench_matmul.py
+"""
+import random
+import time
+
+import matrices
+
+SIZES = (64, 128, 256)
+
+def naive_matmul(a, b):
+    # The element-by-element loop the form route used before matrices.py
+    result = [[0] * len(b[0]) for _ in a]
+    for i in range(len(a)):
+        for j in range(len(b[0])):
+            for k in range(len(b)):
+                result[i][j] += a[i][k] * b[k][j]
+    return result
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    print(f"{'size':>6} {'naive':>10} {'blocked':>10} {'speedup':>8} {'numpy':>10}")
+    for n in SIZES:
+        a = [[random.uniform(-1, 1) for _ in range(n)] for _ in range(n)]
+        b = [[random.uniform(-1, 1) for _ in range(n)] for _ in range(n)]
+        expected, naive = timed(naive_matmul, a, b)
+        product, blocked = timed(matrices.blocked_matmul, a, b)
+        assert all(abs(x - y) < 1e-9 for row, ref in zip(product, expected) for x, y in zip(row, ref))
+
+        numpy = ''
+        if matrices.np is not None:
+            _, seconds = timed(matrices.np.matmul, matrices.np.array(a), matrices.np.array(b))
+            numpy = f'{seconds:9.4f}s'
+        print(f'{n:>6} {naive:9.4f}s {blocked:9.4f}s {naive / blocked:7.1f}x {numpy:>10}')
+
+if __name__ == '__main__':
+    main()
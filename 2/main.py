@@ -1,7 +1,30 @@
-from flask import Flask, request, render_template_string
+import os
+
+from flask import Flask, Response, request, render_template_string
+
+import jobs
+import matrices
+from matrices import (MAX_SPARSE_FLOPS, NPY_MIMETYPE, RAW_MIMETYPE, SPARSE_FLOP_COST, SparseMatrix,
+                      chain_dims, chain_order, encode_binary, matrix_power, multiply,
+                      multiply_batch, multiply_chain, multiply_sparse, multiply_with,
+                      parse_algorithm, parse_chain, parse_npy_operands, parse_operands, parse_power,
+                      parse_raw_operands, parse_sparse_operands, power_multiplications,
+                      product_cache, product_flops, product_key, sparse_flops, sparse_to_json,
+                      to_lists)
 
 app = Flask(__name__)
 
+# Products needing more scalar multiplications than this run as background jobs
+INLINE_MAX_FLOPS = int(os.environ.get('INLINE_MAX_FLOPS', 1 << 26))
+
+# Largest result returned, in elements. Results are encoded in this process
+# even when a job computed them
+MAX_RESULT_ELEMENTS = int(os.environ.get('MAX_RESULT_ELEMENTS', 1 << 20))
+
+# Converting one result element to JSON costs about as much as this many
+# multiplications, so large results count toward INLINE_MAX_FLOPS
+RESULT_ELEMENT_FLOPS = 64
+
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html>
@@ -90,16 +113,220 @@ def multiply_matrices():
                 [int(request.form['b10']), int(request.form['b11'])]
             ]
 
-            # Matrix multiplication logic
-            result = [[0, 0], [0, 0]]
-            for i in range(2):
-                for j in range(2):
-                    result[i][j] = matrix_a[i][0] * matrix_b[0][j] + matrix_a[i][1] * matrix_b[1][j]
+            result = to_lists(multiply(*parse_operands(matrix_a, matrix_b)))
 
         except ValueError:
             result = [["Error", "in"], ["input", "!"]]
 
     return render_template_string(HTML_TEMPLATE, result=result)
 
+def offload(func, *args, on_done=None):
+    """Queue func(*args) as a background job and point the client at it."""
+    try:
+        job_id = jobs.submit(func, *args, on_done=on_done)
+    except jobs.JobQueueFull:
+        return {"error": "Too many matrix jobs are running. Please retry later."}, 503
+    return {"id": job_id, "status": "pending"}, 202, {'Location': f'/jobs/{job_id}'}
+
+def check_result_size(elements):
+    """Return an error response if a result would have too many elements."""
+    if elements > MAX_RESULT_ELEMENTS:
+        return {"error": f"The result would have {elements} elements, more than the limit "
+                         f"of {MAX_RESULT_ELEMENTS}."}, 413
+    return None
+
+def product_json(product):
+    product = to_lists(product)
+    return {"shape": [len(product), len(product[0])], "result": product}
+
+def product_binary(product, mimetype):
+    body, headers = encode_binary(product, mimetype)
+    return Response(body, mimetype=mimetype, headers=headers)
+
+def respond_with_product(a, b, algorithm, leaf, render):
+    """Render the cached or freshly computed product, or queue it as a job if it is too large."""
+    elements = len(a) * len(b[0])
+    error = check_result_size(elements)
+    if error is not None:
+        return error
+    key = product_key(a, b, algorithm, leaf)
+    product = product_cache.get(key)
+    if product is None:
+        if product_flops(a, b, algorithm, leaf) + RESULT_ELEMENT_FLOPS * elements > INLINE_MAX_FLOPS:
+            return offload(multiply_with, a, b, algorithm, leaf,
+                           on_done=lambda result: product_cache.put(key, result))
+        product = multiply_with(a, b, algorithm, leaf)
+        product_cache.put(key, product)
+    return render(product)
+
+# The *_result functions build a response body. They run either inline or
+# in the job pool, so they live at module level where the pool can find them
+
+def chain_result(chain, algorithm, leaf, plan):
+    product, order, flops, left_to_right = multiply_chain(chain, algorithm, leaf, plan)
+    return dict(product_json(product), order=order, flops=flops,
+                left_to_right_flops=left_to_right, flops_saved=left_to_right - flops)
+
+def power_result(a, k, mod):
+    return dict(product_json(matrix_power(a, k, mod)), multiplications=power_multiplications(k))
+
+def batch_result(operands):
+    return {"results": [product_json(product) for product in multiply_batch(operands)]}
+
+def sparse_result(a, b):
+    product = multiply_sparse(a, b)
+    if isinstance(product, SparseMatrix):
+        return {"shape": list(product.shape), "format": "csr", "result": sparse_to_json(product)}
+    return {"shape": list(product.shape), "format": "dense", "result": product.tolist()}
+
+@app.route('/api/matmul', methods=['POST'])
+def api_multiply_matrices():
+    if request.mimetype in (NPY_MIMETYPE, RAW_MIMETYPE):
+        return multiply_binary()
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {"error": "Please provide a JSON object with matrices 'a' and 'b'."}, 400
+    if isinstance(payload.get('a'), dict) or isinstance(payload.get('b'), dict):
+        return multiply_sparse_json(payload)
+    try:
+        a, b = parse_operands(payload.get('a'), payload.get('b'))
+        algorithm, leaf = parse_algorithm(payload)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    return respond_with_product(a, b, algorithm, leaf, product_json)
+
+@app.route('/api/matmul/cache')
+def product_cache_stats():
+    return product_cache.stats()
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    try:
+        timeout = float(request.args.get('wait', 0))
+    except ValueError:
+        return {"error": "'wait' must be a number of seconds."}, 400
+
+    future = jobs.get(job_id, timeout)
+    if future is None:
+        return {"error": "Unknown or expired job."}, 404
+    if not future.done():
+        return {"id": job_id, "status": "running" if future.running() else "pending"}
+    try:
+        result = future.result()
+    except Exception as e:
+        return {"id": job_id, "status": "failed", "error": str(e)}
+    if isinstance(result, dict):
+        return dict(result, id=job_id, status="done")
+
+    # Plain products can be fetched in the binary forms /api/matmul accepts
+    mimetype = request.accept_mimetypes.best_match(['application/json', NPY_MIMETYPE, RAW_MIMETYPE])
+    if mimetype in (NPY_MIMETYPE, RAW_MIMETYPE) and matrices.np is not None:
+        return product_binary(result, mimetype)
+    return dict(product_json(result), id=job_id, status="done")
+
+def multiply_sparse_json(payload):
+    if matrices.np is None:
+        return {"error": "Sparse matrices require NumPy on the server."}, 415
+    try:
+        a, b = parse_sparse_operands(payload.get('a'), payload.get('b'))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    if not (isinstance(a, SparseMatrix) and isinstance(b, SparseMatrix)):
+        # A product with a dense operand is built as a dense array
+        error = check_result_size(a.shape[0] * b.shape[1])
+        if error is not None:
+            return error
+    flops = sparse_flops(a, b)
+    if flops > MAX_SPARSE_FLOPS:
+        return {"error": f"The product needs {flops} scalar multiplications, more than the limit "
+                         f"of {MAX_SPARSE_FLOPS} for sparse operands."}, 413
+    if flops * SPARSE_FLOP_COST > INLINE_MAX_FLOPS:
+        return offload(sparse_result, a, b)
+    return sparse_result(a, b)
+
+def multiply_binary():
+    if matrices.np is None:
+        return {"error": "Binary matrix bodies require NumPy on the server."}, 415
+    data = request.get_data()
+    try:
+        if request.mimetype == NPY_MIMETYPE:
+            a, b = parse_npy_operands(data)
+        else:
+            a, b = parse_raw_operands(data, request.headers.get('X-Dtype'),
+                                      request.headers.get('X-Shape-A'), request.headers.get('X-Shape-B'))
+        options = dict(request.args)
+        # Non-numeric values are left for parse_algorithm() to reject
+        if options.get('leaf_size', '').isdecimal():
+            options['leaf_size'] = int(options['leaf_size'])
+        algorithm, leaf = parse_algorithm(options)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    mimetype = request.mimetype
+    return respond_with_product(a, b, algorithm, leaf, lambda product: product_binary(product, mimetype))
+
+@app.route('/api/matmul/chain', methods=['POST'])
+def api_multiply_chain():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {"error": "Please provide a JSON object with a list of 'matrices'."}, 400
+    try:
+        chain = parse_chain(payload.get('matrices'))
+        algorithm, leaf = parse_algorithm(payload)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # The ordering is worked out once and reused by the multiplication
+    dims = chain_dims(chain)
+    error = check_result_size(dims[0] * dims[-1])
+    if error is not None:
+        return error
+    plan = chain_order(dims)
+    if plan[0] + RESULT_ELEMENT_FLOPS * dims[0] * dims[-1] > INLINE_MAX_FLOPS:
+        return offload(chain_result, chain, algorithm, leaf, plan)
+    return chain_result(chain, algorithm, leaf, plan)
+
+@app.route('/api/matpow', methods=['POST'])
+def api_matrix_power():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {"error": "Please provide a JSON object with a square matrix 'a' and an exponent 'k'."}, 400
+    try:
+        a, k, mod = parse_power(payload.get('a'), payload.get('k'), payload.get('mod'))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    if len(a) ** 3 * power_multiplications(k) > INLINE_MAX_FLOPS:
+        return offload(power_result, a, k, mod)
+    try:
+        return power_result(a, k, mod)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+@app.route('/api/matmul/batch', methods=['POST'])
+def api_multiply_batch():
+    payload = request.get_json(silent=True)
+    pairs = payload.get('pairs') if isinstance(payload, dict) else None
+    if not isinstance(pairs, list) or not pairs or not all(isinstance(p, dict) for p in pairs):
+        return {"error": "Please provide 'pairs' as a non-empty list of {'a': ..., 'b': ...} objects."}, 400
+    operands = []
+    for index, pair in enumerate(pairs):
+        try:
+            operands.append(parse_operands(pair.get('a'), pair.get('b')))
+        except ValueError as e:
+            return {"error": f"Pair {index}: {e}"}, 400
+
+    elements = sum(len(a) * len(b[0]) for a, b in operands)
+    error = check_result_size(elements)
+    if error is not None:
+        return error
+    flops = sum(len(a) * len(b) * len(b[0]) for a, b in operands)
+    if flops + RESULT_ELEMENT_FLOPS * elements > INLINE_MAX_FLOPS:
+        return offload(batch_result, operands)
+    return batch_result(operands)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
@@ -1,7 +1,23 @@
-from flask import Flask, render_template_string
+import gzip
+import hashlib
+import io
+
+import numpy as np
+from flask import Flask, Response, render_template_string, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
+# How long browsers may reuse the home page before revalidating its ETag
+HOME_CACHE_SECONDS = 86400
+
+# Largest n served, matching the limit of the form's number input
+MAX_N = 1000000
+
 # HTML template as a string
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -207,11 +223,18 @@ input[type="number"]:focus {
     text-shadow: 0 1px 3px rgba(0, 0, 0, 0.3);
 }
 
+.numbers-viewport {
+    max-height: 420px;
+    overflow-y: auto;
+    margin-top: 20px;
+}
+
 .numbers-grid {
     display: grid;
     grid-template-columns: repeat(auto-fill, minmax(60px, 1fr));
+    grid-auto-rows: 52px;
     gap: 12px;
-    margin-top: 20px;
+    will-change: transform;
 }
 
 .number-item {
@@ -298,7 +321,7 @@ input[type="number"]:focus {
         <form id="evenForm">
             <div class="input-group">
                 <label for="numberInput">Enter the count of even numbers:</label>
-                <input type="number" id="numberInput" name="n" min="1" max="1000" value="10" required>
+                <input type="number" id="numberInput" name="n" min="1" max="1000000" value="10" required>
             </div>
             
             <button type="submit" class="btn">Generate Numbers</button>
@@ -309,7 +332,11 @@ input[type="number"]:focus {
         
         <div class="result" id="result">
             <h3 id="resultTitle"></h3>
-            <div class="numbers-grid" id="numbersGrid"></div>
+            <div class="numbers-viewport" id="numbersViewport">
+                <div id="numbersSpacer">
+                    <div class="numbers-grid" id="numbersGrid"></div>
+                </div>
+            </div>
         </div>
     </div>
 
@@ -319,14 +346,21 @@ input[type="number"]:focus {
         const result = document.getElementById('result');
         const resultTitle = document.getElementById('resultTitle');
         const numbersGrid = document.getElementById('numbersGrid');
+        const numbersViewport = document.getElementById('numbersViewport');
+        const numbersSpacer = document.getElementById('numbersSpacer');
+
+        // Rows rendered above and below the visible window
+        const OVERSCAN_ROWS = 4;
+        let currentNumbers = null;
+        let renderScheduled = false;
 
         form.addEventListener('submit', function(e) {
             e.preventDefault();
             
             const n = parseInt(document.getElementById('numberInput').value);
             
-            if (isNaN(n) || n < 1 || n > 1000) {
-                showError('Please enter a valid number between 1 and 1000.');
+            if (isNaN(n) || n < 1 || n > 1000000) {
+                showError('Please enter a valid number between 1 and 1000000.');
                 return;
             }
 
@@ -338,40 +372,88 @@ input[type="number"]:focus {
             loading.classList.add('show');
             result.classList.remove('show');
             
-            // Simulate API call delay for better UX
-            setTimeout(() => {
-                try {
-                    const evenNumbers = [];
-                    for (let i = 1; i <= n; i++) {
-                        evenNumbers.push(2 * i);
+            fetch(`/api/even?n=${n}&encoding=range`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
                     }
+                    return response.json();
+                })
+                .then(data => displayResult(data.n, rangeSequence(data)))
+                .catch(() => showError('An error occurred while generating numbers.'))
+                .finally(() => loading.classList.remove('show'));
+        }
 
-                    displayResult(n, evenNumbers);
-                } catch (error) {
-                    showError('An error occurred while generating numbers.');
-                } finally {
-                    loading.classList.remove('show');
-                }
-            }, 300);
+        // Expands a {start, step, count} descriptor on demand instead of materialising it
+        function rangeSequence(range) {
+            return {
+                length: range.count,
+                at: index => range.start + index * range.step,
+            };
         }
 
         function displayResult(n, numbers) {
             resultTitle.textContent = `The first ${n} even numbers are:`;
-            
-            numbersGrid.innerHTML = '';
-            numbers.forEach((num, index) => {
+            currentNumbers = numbers;
+
+            // The grid has to be laid out before its rows can be measured
+            result.className = 'result show';
+            numbersViewport.scrollTop = 0;
+            renderVisibleRows();
+        }
+
+        function gridMetrics() {
+            const style = getComputedStyle(numbersGrid);
+            return {
+                columns: Math.max(1, style.gridTemplateColumns.split(' ').length),
+                rowHeight: parseFloat(style.gridAutoRows) + (parseFloat(style.rowGap) || 0),
+            };
+        }
+
+        // Only the rows inside the viewport exist in the DOM; the spacer keeps
+        // the scrollbar sized for the whole result
+        function renderVisibleRows() {
+            renderScheduled = false;
+            if (!currentNumbers) {
+                return;
+            }
+
+            const { columns, rowHeight } = gridMetrics();
+            const totalRows = Math.ceil(currentNumbers.length / columns);
+            const top = numbersViewport.scrollTop;
+            const firstRow = Math.max(0, Math.floor(top / rowHeight) - OVERSCAN_ROWS);
+            const lastRow = Math.min(totalRows,
+                Math.ceil((top + numbersViewport.clientHeight) / rowHeight) + OVERSCAN_ROWS);
+
+            const fragment = document.createDocumentFragment();
+            const end = Math.min(currentNumbers.length, lastRow * columns);
+            for (let index = firstRow * columns; index < end; index++) {
                 const numElement = document.createElement('div');
                 numElement.className = 'number-item';
-                numElement.textContent = num;
-                numElement.style.animationDelay = `${index * 0.05}s`;
-                numbersGrid.appendChild(numElement);
-            });
+                numElement.textContent = currentNumbers.at(index);
+                fragment.appendChild(numElement);
+            }
 
-            result.className = 'result show';
+            numbersSpacer.style.height = `${totalRows * rowHeight}px`;
+            numbersGrid.style.transform = `translateY(${firstRow * rowHeight}px)`;
+            numbersGrid.replaceChildren(fragment);
         }
 
+        function scheduleRender() {
+            if (!renderScheduled) {
+                renderScheduled = true;
+                requestAnimationFrame(renderVisibleRows);
+            }
+        }
+
+        numbersViewport.addEventListener('scroll', scheduleRender);
+        window.addEventListener('resize', scheduleRender);
+
         function showError(message) {
             resultTitle.textContent = 'Error';
+            currentNumbers = null;
+            numbersSpacer.style.height = '';
+            numbersGrid.style.transform = '';
             numbersGrid.innerHTML = `<div style="grid-column: 1 / -1; color: #d63031; font-weight: 500;">${message}</div>`;
             result.className = 'result show error';
             loading.classList.remove('show');
@@ -390,9 +472,73 @@ input[type="number"]:focus {
 </html>
 """
 
+def even_array(n):
+    return np.arange(2, 2 * n + 1, 2, dtype='<i8')
+
+def render_even_array(arr, fmt):
+    if fmt == 'npy':
+        buf = io.BytesIO()
+        np.save(buf, arr)
+        return Response(buf.getvalue(), mimetype='application/octet-stream')
+    if fmt == 'raw':
+        return Response(arr.tobytes(), mimetype='application/octet-stream',
+                        headers={'X-Dtype': arr.dtype.str})
+    buf = io.StringIO()
+    np.savetxt(buf, arr, fmt='%d')
+    return Response(buf.getvalue(), mimetype='text/plain')
+
+# The template has no variables, so render and compress it once at import
+with app.app_context():
+    HOME_PAGE = render_template_string(HTML_TEMPLATE).encode('utf-8')
+HOME_ETAG = hashlib.sha256(HOME_PAGE).hexdigest()[:32]
+HOME_VARIANTS = {'gzip': gzip.compress(HOME_PAGE, compresslevel=9, mtime=0)}
+if brotli is not None:
+    HOME_VARIANTS['br'] = brotli.compress(HOME_PAGE)
+
 @app.route('/')
 def home():
-    return render_template_string(HTML_TEMPLATE)
+    encoding = request.accept_encodings.best_match(
+        [e for e in ('br', 'gzip') if e in HOME_VARIANTS])
+    response = Response(HOME_VARIANTS.get(encoding, HOME_PAGE), mimetype='text/html')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.max_age = HOME_CACHE_SECONDS
+    response.set_etag(f'{HOME_ETAG}-{encoding or "identity"}')
+    return response.make_conditional(request)
+
+@app.route('/even')
+def even_numbers():
+    try:
+        n = int(request.args.get('n', 10))
+    except ValueError:
+        return {"error": "Please provide an integer value for 'n'."}, 400
+    if n > MAX_N:
+        return {"error": f"'n' must be at most {MAX_N}."}, 400
+
+    fmt = request.args.get('format', 'text')
+    if fmt not in ('npy', 'raw', 'text'):
+        return {"error": "Invalid format. Use 'npy', 'raw' or 'text'."}, 400
+    return render_even_array(even_array(n), fmt)
+
+@app.route('/api/even')
+def api_even_numbers():
+    try:
+        n = int(request.args.get('n', 10))
+    except ValueError:
+        return {"error": "Please provide an integer value for 'n'."}, 400
+    if n < 1:
+        return {"error": "'n' must be a positive integer."}, 400
+    if n > MAX_N:
+        return {"error": f"'n' must be at most {MAX_N}."}, 400
+
+    encoding = request.args.get('encoding')
+    if encoding == 'range':
+        return {"n": n, "start": 2, "step": 2, "count": n}
+    if encoding is not None:
+        return {"error": "Invalid encoding. Use 'range'."}, 400
+    return {"n": n, "numbers": even_array(n).tolist()}
 
 @app.route('/health')
 def health_check():
@@ -0,0 +1,83 @@
+"""ASGI entry point for the even-number service.
+
+Run with ``uvicorn asgi:app`` (needs ``asgiref`` and ``uvicorn``). Streamed
+sequences (``/?stream=1``) are sent natively, so a slow reader only holds a
+coroutine instead of a whole worker. Every other request is handed to the
+Flask app in ``main``, so both entry points answer identically.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+
+from main import PROXY_HOPS, admit_request
+from main import app as flask_app
+from main import is_streamed, stream_even_numbers
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+def streamed_n(scope, args):
+    # The same requests main.generate_even_numbers answers with a stream
+    if scope['type'] != 'http' or scope['method'] != 'GET' or scope['path'] != '/':
+        return None
+    if not is_streamed('generate_even_numbers', args):
+        return None
+    try:
+        return int(args.get('n', 10))
+    except ValueError:
+        return None
+
+async def send_error(send, body, status, headers=None):
+    payload = json.dumps(body).encode()
+    raw_headers = [(b'content-type', b'application/json'),
+                   (b'content-length', str(len(payload)).encode())]
+    raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+async def stream_response(n, receive, send):
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/html; charset=utf-8')],
+        })
+        for chunk in stream_even_numbers(n):
+            if disconnected.is_set():
+                return
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+
+def client_address(scope):
+    """Return the client address the same way ProxyFix does for the Flask app."""
+    forwarded = [value for name, value in scope.get('headers', []) if name == b'x-forwarded-for']
+    hops = [hop.strip() for hop in b','.join(forwarded).decode('latin-1').split(',')]
+    if PROXY_HOPS and forwarded and len(hops) >= PROXY_HOPS:
+        return hops[-PROXY_HOPS]
+    return scope['client'][0] if scope.get('client') else None
+
+async def app(scope, receive, send):
+    args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'),
+                               keep_blank_values=True))
+    n = streamed_n(scope, args)
+    if n is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    error = admit_request(client_address(scope), 'generate_even_numbers', args, streamed=True)
+    if error is not None:
+        await send_error(send, *error)
+    else:
+        await stream_response(n, receive, send)
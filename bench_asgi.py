@@ -0,0 +1,91 @@
+"""Compare the gunicorn setup from app.yaml with the ASGI entry point.
+
+Each server is started in turn. SLOW_CLIENTS connections then read a large
+streamed sequence slowly, and the script times how long cheap /nth requests
+take to be answered in the meantime. Needs gunicorn and uvicorn installed.
+
+    python bench_asgi.py
+"""
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+HOST = '127.0.0.1'
+PORT = 8765
+SLOW_CLIENTS = 8
+SLOW_N = 2000000
+PROBES = 20
+PROBE_TIMEOUT = 5.0
+
+SERVERS = {
+    'gunicorn (sync)': ['gunicorn', '-b', f'{HOST}:{PORT}', 'main:app'],
+    'uvicorn (asgi)': [sys.executable, '-m', 'uvicorn', '--host', HOST,
+                       '--port', str(PORT), '--log-level', 'warning', 'asgi:app'],
+}
+
+# All clients share one address, so lift the per-client rate limit
+SERVER_ENV = dict(os.environ, RATE_LIMIT_BURST_BYTES=str(1 << 40))
+
+def wait_for_server(timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, PORT, timeout=1)
+            conn.request('GET', '/nth?n=1')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+def slow_reader(stop):
+    try:
+        conn = http.client.HTTPConnection(HOST, PORT, timeout=PROBE_TIMEOUT * 4)
+        conn.request('GET', f'/?n={SLOW_N}&stream=1')
+        response = conn.getresponse()
+        while not stop.is_set() and response.read(1024):
+            time.sleep(0.05)
+        conn.close()
+    except OSError:
+        pass
+
+def probe():
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection(HOST, PORT, timeout=PROBE_TIMEOUT)
+        conn.request('GET', '/nth?n=5')
+        conn.getresponse().read()
+        conn.close()
+    except OSError:
+        return None
+    return time.perf_counter() - start
+
+def run(name, command):
+    server = subprocess.Popen(command, env=SERVER_ENV,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server()
+        stop = threading.Event()
+        readers = [threading.Thread(target=slow_reader, args=(stop,), daemon=True)
+                   for _ in range(SLOW_CLIENTS)]
+        for reader in readers:
+            reader.start()
+        time.sleep(1.0)
+
+        latencies = [probe() for _ in range(PROBES)]
+        stop.set()
+        answered = [latency for latency in latencies if latency is not None]
+        median = f'{statistics.median(answered) * 1000:8.1f} ms' if answered else '     n/a'
+        print(f'{name:18} answered {len(answered):2}/{PROBES}  median latency {median}')
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    print(f'{SLOW_CLIENTS} slow clients streaming n={SLOW_N}, {PROBES} probes of /nth')
+    for name, command in SERVERS.items():
+        run(name, command)
@@ -1,7 +1,329 @@
-from flask import Flask, request
+import base64
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from flask import Flask, Response, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from sequences import (INT64_MAX, arithmetic_chunks, arithmetic_largest, prime_chunks,
+                       prime_upper_bound)
 
 app = Flask(__name__)
 
+# Proxies in front of the app that append to X-Forwarded-For (App Engine's
+# front end is one). Clients are told apart by the address that the outermost
+# trusted proxy saw; with 0, remote_addr is the proxy and the limit is global
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 1))
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+# Total size of response bodies kept in memory by the response cache
+RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Bytes each cached response costs beyond its body: the key, the entry
+# tuple, headers dict, ETag string and the dictionary node
+CACHE_ENTRY_OVERHEAD = 512
+
+# Numbers formatted per chunk when streaming
+CHUNK_SIZE = 4096
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+
+# Admission control: per-request caps on the estimated body size, and a
+# per-client token bucket that is charged that estimate in bytes
+MAX_RESPONSE_BYTES = int(os.environ.get('MAX_RESPONSE_BYTES', 64 * 1024 * 1024))
+MAX_STREAM_BYTES = int(os.environ.get('MAX_STREAM_BYTES', 1024 * 1024 * 1024))
+RATE_LIMIT_BYTES_PER_SECOND = int(os.environ.get('RATE_LIMIT_BYTES_PER_SECOND', 16 * 1024 * 1024))
+RATE_LIMIT_BURST_BYTES = int(os.environ.get('RATE_LIMIT_BURST_BYTES', MAX_RESPONSE_BYTES))
+MIN_REQUEST_COST = 16 * 1024
+MAX_TRACKED_CLIENTS = 10000
+
+def stream_even_numbers(n):
+    yield f'The first {n} even numbers are: ['
+    for start in range(1, n + 1, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, n + 1)
+        batch = ', '.join(str(2 * i) for i in range(start, stop))
+        yield batch if start == 1 else ', ' + batch
+    yield ']'
+
+def even_array(n):
+    return np.arange(2, 2 * n + 1, 2, dtype='<i8')
+
+# Media types offered through Accept negotiation on /, mapped to their
+# format= names. text/html (the human sentence) comes first so that */*
+# and browsers keep getting it.
+ACCEPT_FORMATS = {
+    'text/html': None,
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'text/csv': 'csv',
+    'text/plain': 'text',
+    'application/octet-stream': 'raw',
+    'application/x-npy': 'npy',
+}
+FORMATS = [fmt for fmt in ACCEPT_FORMATS.values() if fmt is not None] + ['fixed']
+FORMAT_MIMETYPES = {fmt: mimetype for mimetype, fmt in ACCEPT_FORMATS.items() if fmt is not None}
+
+# Sequences served by /sequence/<kind>, all streamed chunk by chunk
+SEQUENCE_KINDS = ('even', 'odd', 'multiples', 'arithmetic', 'primes')
+SEQUENCE_FORMATS = ('text', 'ndjson', 'csv', 'json', 'raw', 'npy')
+
+# Fixed-width encodings, where element k starts at byte (k - 1) * width,
+# so any byte range can be served without generating what precedes it
+RANGE_FORMATS = ('raw', 'fixed')
+MAX_INT64_N = 2 ** 62 - 1
+
+def format_array(arr, newline='\n', header=''):
+    buf = io.StringIO()
+    np.savetxt(buf, arr, fmt='%d', newline=newline, header=header, comments='')
+    return buf.getvalue()
+
+def render_even_array(arr, fmt):
+    if fmt == 'npy':
+        buf = io.BytesIO()
+        np.save(buf, arr)
+        return buf.getvalue(), 'application/x-npy', {}
+    if fmt == 'raw':
+        # Packed int64 straight from the array buffer, no per-element objects
+        return arr.tobytes(), 'application/octet-stream', {'X-Dtype': arr.dtype.str}
+    if fmt == 'json':
+        return f'[{format_array(arr, newline=",")[:-1]}]'.encode(), 'application/json', {}
+    if fmt == 'ndjson':
+        return format_array(arr).encode(), 'application/x-ndjson', {}
+    if fmt == 'csv':
+        return format_array(arr, newline='\r\n', header='value').encode(), 'text/csv', {}
+    if fmt == 'fixed':
+        return format_fixed(arr, element_width(len(arr), fmt)), 'text/plain', {}
+    return format_array(arr).encode(), 'text/plain', {}
+
+def element_width(n, fmt):
+    if fmt == 'raw':
+        return 8
+    # Right-aligned decimal wide enough for the largest element, plus newline
+    return len(str(2 * n)) + 1
+
+def format_fixed(arr, width):
+    buf = io.StringIO()
+    np.savetxt(buf, arr, fmt=f'%{width - 1}d')
+    return buf.getvalue().encode()
+
+def read_virtual_sequence(n, fmt, start, stop):
+    """Return bytes [start, stop) of the fixed-width encoding of the first n even numbers."""
+    width = element_width(n, fmt)
+    first = start // width
+    last = min(n, -(-stop // width))
+    arr = np.arange(2 * (first + 1), 2 * last + 1, 2, dtype='<i8')
+    data = arr.tobytes() if fmt == 'raw' else format_fixed(arr, width)
+    return data[start - first * width:stop - first * width]
+
+def sequence_etag(n, fmt):
+    # Fixed-width bodies are determined by n and the format alone, so the
+    # full and partial responses share a validator without rendering either
+    return hashlib.sha256(f'even:{fmt}:{n}'.encode()).hexdigest()
+
+def serves_range(n, fmt, byte_range, if_range):
+    """Whether a Range request is answered with 206 rather than the full body."""
+    # Multi-range requests are answered with the full body
+    if byte_range is None or len(byte_range.ranges) != 1:
+        return False
+    if if_range is not None and (if_range.etag or if_range.date):
+        return if_range.etag == sequence_etag(n, fmt)
+    return True
+
+def ranged_even_response(n, fmt):
+    length = max(n, 0) * element_width(n, fmt)
+    byte_range = request.range.range_for_length(length)
+    if byte_range is None:
+        return Response(status=416, headers={'Content-Range': f'bytes */{length}'})
+    start, stop = byte_range
+    response = Response(read_virtual_sequence(n, fmt, start, stop), status=206,
+                        mimetype='application/octet-stream' if fmt == 'raw' else 'text/plain')
+    response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{length}'
+    response.accept_ranges = 'bytes'
+    response.set_etag(sequence_etag(n, fmt))
+    return response
+
+def render_even_numbers(n, fmt):
+    if fmt is None:
+        even_numbers = [2 * i for i in range(1, n + 1)]
+        return f'The first {n} even numbers are: {even_numbers}'.encode(), 'text/html', {}
+    return render_even_array(even_array(n), fmt)
+
+CachedResponse = namedtuple('CachedResponse', 'body mimetype headers etag')
+
+def entry_size(entry):
+    return CACHE_ENTRY_OVERHEAD + len(entry.body)
+
+class ResponseCache:
+    """LRU cache of rendered response bodies bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if entry_size(entry) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= entry_size(old)
+            self._entries[key] = entry
+            self.size += entry_size(entry)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= entry_size(evicted)
+
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+
+def cached_even_response(n, fmt):
+    key = (n, fmt)
+    entry = response_cache.get(key)
+    if entry is None:
+        body, mimetype, headers = render_even_numbers(n, fmt)
+        etag = sequence_etag(n, fmt) if fmt in RANGE_FORMATS else hashlib.sha256(body).hexdigest()
+        entry = CachedResponse(body, mimetype, headers, etag)
+        # Empty sequences are trivial to render, and any number of distinct
+        # n <= 0 would otherwise fill the cache
+        if n > 0:
+            response_cache.put(key, entry)
+    response = Response(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+    response.set_etag(entry.etag)
+    return response.make_conditional(request)
+
+def encode_cursor(offset, limit):
+    return base64.urlsafe_b64encode(f'{offset}:{limit}'.encode()).decode()
+
+def decode_cursor(cursor):
+    offset, limit = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+    return int(offset), int(limit)
+
+def even_page(n, offset, limit):
+    # Element k of the sequence is 2 * k, so any window is addressed directly
+    count = max(0, min(limit, n - offset))
+    items = [2 * (offset + i) for i in range(1, count + 1)]
+    next_offset = offset + count
+    return {
+        'n': n,
+        'offset': offset,
+        'limit': limit,
+        'items': items,
+        'next_cursor': encode_cursor(next_offset, limit) if next_offset < n else None,
+    }
+
+def sequence_bytes(count, fmt=None, largest=None):
+    if count <= 0:
+        return 0
+    if fmt in ('npy', 'raw'):
+        return 8 * count
+    if largest is None:
+        largest = 2 * count
+    # Decimal digits of the largest element plus a sign and a separator
+    return count * (largest.bit_length() * 30103 // 100000 + 3)
+
+def is_streamed(endpoint, args):
+    if endpoint == 'generate_sequence':
+        return True
+    return (endpoint == 'generate_even_numbers' and args.get('stream') == '1'
+            and not any(key in args for key in ('offset', 'limit', 'cursor', 'format', 'encoding')))
+
+def estimate_response_bytes(endpoint, args, payload=None, byte_range=None, view_args=None,
+                            if_range=None):
+    """Upper bound on the response body, worked out from the parameters alone."""
+    if endpoint == 'generate_even_numbers':
+        n = int(args.get('n', 10))
+        if 'encoding' in args:
+            return 0
+        fmt = args.get('format')
+        if fmt in RANGE_FORMATS and 0 < n <= MAX_INT64_N and serves_range(n, fmt, byte_range, if_range):
+            window = byte_range.range_for_length(n * element_width(n, fmt))
+            return window[1] - window[0] if window else 0
+        if any(key in args for key in ('offset', 'limit', 'cursor')):
+            return sequence_bytes(min(n, MAX_PAGE_SIZE)) + (2 * n).bit_length()
+        return sequence_bytes(n, args.get('format'))
+    if endpoint == 'generate_even_numbers_batch':
+        values = payload.get('n') if isinstance(payload, dict) else payload
+        # Anything but plain integers is rejected by the route itself
+        return sum(sequence_bytes(n) for n in values if isinstance(n, int) and not isinstance(n, bool))
+    if endpoint == 'generate_sequence':
+        n, _, largest = sequence_spec(view_args['kind'], args)
+        return sequence_bytes(n, args.get('format'), largest)
+    return 0
+
+class TokenBucket:
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, amount):
+        """Spend amount tokens and return 0, or return the seconds until they are available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0
+        return (amount - self.tokens) / self.rate
+
+client_buckets = OrderedDict()
+client_buckets_lock = threading.Lock()
+
+def charge_client(client, cost):
+    with client_buckets_lock:
+        bucket = client_buckets.pop(client, None)
+        if bucket is None:
+            bucket = TokenBucket(RATE_LIMIT_BURST_BYTES, RATE_LIMIT_BYTES_PER_SECOND)
+        client_buckets[client] = bucket
+        if len(client_buckets) > MAX_TRACKED_CLIENTS:
+            client_buckets.popitem(last=False)
+        return bucket.take(min(max(cost, MIN_REQUEST_COST), RATE_LIMIT_BURST_BYTES))
+
+def admit_request(client, endpoint, args, payload=None, streamed=None, byte_range=None,
+                  view_args=None, if_range=None):
+    """Return an error response if the request is too costly or the client is over its rate."""
+    try:
+        size = estimate_response_bytes(endpoint, args, payload, byte_range, view_args, if_range)
+    except (TypeError, ValueError):
+        # Malformed parameters are rejected by the route itself
+        return None
+    if streamed is None:
+        streamed = is_streamed(endpoint, args)
+    limit = MAX_STREAM_BYTES if streamed else MAX_RESPONSE_BYTES
+    if size > limit:
+        return {"error": f"Estimated response size of {size} bytes exceeds the limit of {limit} bytes."}, 413
+
+    wait = charge_client(client, size)
+    if wait:
+        return {"error": "Rate limit exceeded. Please retry later."}, 429, {'Retry-After': str(math.ceil(wait))}
+    return None
+
+@app.before_request
+def admission_control():
+    payload = None
+    if request.endpoint == 'generate_even_numbers_batch':
+        payload = request.get_json(silent=True)
+    return admit_request(request.remote_addr, request.endpoint, request.args, payload,
+                         byte_range=request.range, view_args=request.view_args,
+                         if_range=request.if_range)
+
 @app.route('/')
 def generate_even_numbers():
     try:
@@ -9,8 +331,168 @@ def generate_even_numbers():
     except ValueError:
         return "Invalid input. Please provide an integer value for 'n'."
 
-    even_numbers = [2 * i for i in range(1, n + 1)]
-    return f'The first {n} even numbers are: {even_numbers}'
+    if 'encoding' in request.args:
+        if request.args['encoding'] != 'range':
+            return {"error": "Invalid encoding. Use 'range'."}, 400
+        # The whole sequence is described by its first term, step and length
+        return {"start": 2, "step": 2, "count": max(n, 0)}
+
+    if any(key in request.args for key in ('offset', 'limit', 'cursor')):
+        try:
+            if 'cursor' in request.args:
+                offset, limit = decode_cursor(request.args['cursor'])
+            else:
+                offset = int(request.args.get('offset', 0))
+                limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return {"error": "Invalid offset, limit or cursor."}, 400
+        if offset < 0 or not 1 <= limit <= MAX_PAGE_SIZE:
+            return {"error": f"'offset' must be >= 0 and 'limit' between 1 and {MAX_PAGE_SIZE}."}, 400
+        return even_page(n, offset, limit)
+
+    fmt = request.args.get('format')
+    if fmt is not None:
+        if fmt not in FORMATS:
+            return {"error": f"Invalid format. Use one of: {', '.join(FORMATS)}."}, 400
+        if fmt not in RANGE_FORMATS:
+            return cached_even_response(n, fmt)
+        if n > MAX_INT64_N:
+            return {"error": f"'n' must be at most {MAX_INT64_N} for the {fmt} format."}, 400
+        if serves_range(n, fmt, request.range, request.if_range):
+            return ranged_even_response(n, fmt)
+        response = cached_even_response(n, fmt)
+        response.accept_ranges = 'bytes'
+        return response
+
+    if request.args.get('stream') == '1':
+        return Response(stream_even_numbers(n))
+
+    mimetype = request.accept_mimetypes.best_match(ACCEPT_FORMATS, default='text/html')
+    response = cached_even_response(n, ACCEPT_FORMATS[mimetype])
+    response.vary.add('Accept')
+    return response
+
+@app.route('/batch', methods=['POST'])
+def generate_even_numbers_batch():
+    payload = request.get_json(silent=True)
+    values = payload.get('n') if isinstance(payload, dict) else payload
+    if (not isinstance(values, list) or not values
+            or not all(isinstance(n, int) and not isinstance(n, bool) for n in values)):
+        return {"error": "Please provide a non-empty list of integers for 'n'."}, 400
+
+    # Every answer is a prefix of the longest sequence, so build it once and slice
+    numbers = even_array(max(max(values), 0))
+    results = ({"n": n, "numbers": numbers[:max(n, 0)].tolist()} for n in values)
+
+    if request.args.get('format') == 'ndjson':
+        return Response((json.dumps(result) + '\n' for result in results),
+                        mimetype='application/x-ndjson')
+    return {"results": list(results)}
+
+def int64_arg(args, name, default):
+    try:
+        value = int(args.get(name, default))
+    except ValueError:
+        raise ValueError(f"Please provide an integer value for '{name}'.") from None
+    if not -INT64_MAX - 1 <= value <= INT64_MAX:
+        raise ValueError(f"'{name}' must be within the int64 range.")
+    return value
+
+def sequence_spec(kind, args):
+    """Return (n, chunks, largest) for a /sequence request, or raise ValueError."""
+    n = max(int64_arg(args, 'n', 10), 0)
+    if kind == 'primes':
+        return n, prime_chunks(n), prime_upper_bound(n)
+    if kind == 'even':
+        start, step = 2, 2
+    elif kind == 'odd':
+        start, step = 1, 2
+    elif kind == 'multiples':
+        start = step = int64_arg(args, 'k', 2)
+    elif kind == 'arithmetic':
+        start, step = int64_arg(args, 'start', 0), int64_arg(args, 'step', 1)
+    else:
+        raise ValueError(f'Unknown sequence: {kind}')
+    largest = arithmetic_largest(start, step, n)
+    # step * offset is formed before start is added, so it must fit as well
+    if largest > INT64_MAX or abs(step) * max(n - 1, 0) > INT64_MAX:
+        raise ValueError('Sequence values exceed the int64 range.')
+    return n, arithmetic_chunks(start, step, n), largest
+
+def encode_chunks(chunks, fmt, count):
+    if fmt == 'npy':
+        buf = io.BytesIO()
+        np.lib.format.write_array_header_1_0(
+            buf, {'descr': '<i8', 'fortran_order': False, 'shape': (count,)})
+        yield buf.getvalue()
+    elif fmt == 'json':
+        yield b'['
+    elif fmt == 'csv':
+        yield b'value\r\n'
+
+    separator = b''
+    for arr in chunks:
+        if fmt in ('raw', 'npy'):
+            yield arr.tobytes()
+        elif fmt == 'json':
+            if len(arr):
+                yield separator + format_array(arr, newline=',')[:-1].encode()
+                separator = b','
+        elif fmt == 'csv':
+            yield format_array(arr, newline='\r\n').encode()
+        else:
+            yield format_array(arr).encode()
+
+    if fmt == 'json':
+        yield b']'
+
+@app.route('/sequence/<kind>')
+def generate_sequence(kind):
+    if kind not in SEQUENCE_KINDS:
+        return {"error": f"Unknown sequence. Use one of: {', '.join(SEQUENCE_KINDS)}."}, 404
+    fmt = request.args.get('format', 'text')
+    if fmt not in SEQUENCE_FORMATS:
+        return {"error": f"Invalid format. Use one of: {', '.join(SEQUENCE_FORMATS)}."}, 400
+    try:
+        n, chunks, _ = sequence_spec(kind, request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    return Response(encode_chunks(chunks, fmt, n), mimetype=FORMAT_MIMETYPES[fmt])
+
+def read_n():
+    try:
+        return int(request.args.get('n', 10))
+    except ValueError:
+        return None
+
+@app.route('/nth')
+def nth_even_number():
+    n = read_n()
+    if n is None or n < 1:
+        return {"error": "Please provide a positive integer value for 'n'."}, 400
+    return {"n": n, "value": 2 * n}
+
+@app.route('/sum')
+def sum_even_numbers():
+    n = read_n()
+    if n is None:
+        return {"error": "Please provide an integer value for 'n'."}, 400
+    n = max(n, 0)
+    # 2 + 4 + ... + 2n
+    return {"n": n, "sum": n * (n + 1)}
+
+@app.route('/stats')
+def even_number_stats():
+    n = read_n()
+    if n is None:
+        return {"error": "Please provide an integer value for 'n'."}, 400
+    if n < 1:
+        return {"n": max(n, 0), "count": 0, "min": None, "max": None,
+                "sum": 0, "mean": None, "median": None}
+    # The sequence is symmetric about n + 1, so mean and median coincide
+    return {"n": n, "count": n, "min": 2, "max": 2 * n,
+            "sum": n * (n + 1), "mean": n + 1, "median": n + 1}
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,60 @@
+"""Vectorized generators for the integer sequences served by main.py.
+
+Every generator yields little-endian int64 NumPy arrays of bounded size,
+so callers can stream arbitrarily long sequences in flat memory.
+"""
+import math
+
+import numpy as np
+
+INT64_MAX = 2 ** 63 - 1
+
+# Elements per chunk for closed-form sequences
+CHUNK_SIZE = 1 << 16
+
+# Numbers covered by one sieve segment; 256 KB of flags stays cache resident
+SEGMENT_SIZE = 1 << 18
+
+def arithmetic_chunks(start, step, n):
+    for offset in range(0, n, CHUNK_SIZE):
+        count = min(CHUNK_SIZE, n - offset)
+        yield start + step * np.arange(offset, offset + count, dtype='<i8')
+
+def arithmetic_largest(start, step, n):
+    """Largest absolute value among the first n terms."""
+    return max(abs(start), abs(start + step * (n - 1))) if n > 0 else 0
+
+def prime_upper_bound(n):
+    """Upper bound on the nth prime (Rosser's theorem for n >= 6)."""
+    if n < 6:
+        return 13
+    return int(n * (math.log(n) + math.log(math.log(n)))) + 1
+
+def small_primes(limit):
+    sieve = np.ones(limit + 1, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, math.isqrt(limit) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = False
+    return np.flatnonzero(sieve).tolist()
+
+def prime_chunks(n):
+    """Yield the first n primes, one segment of the sieve at a time."""
+    if n <= 0:
+        return
+    limit = prime_upper_bound(n)
+    base = small_primes(math.isqrt(limit))
+    remaining = n
+    for low in range(2, limit + 1, SEGMENT_SIZE):
+        high = min(low + SEGMENT_SIZE, limit + 1)
+        segment = np.ones(high - low, dtype=bool)
+        for p in base:
+            if p * p >= high:
+                break
+            first = max(p * p, -(-low // p) * p)
+            segment[first - low::p] = False
+        primes = (np.flatnonzero(segment) + low).astype('<i8')[:remaining]
+        remaining -= len(primes)
+        yield primes
+        if not remaining:
+            return
@@ -0,0 +1,91 @@
+"""Background jobs for matrix products too large to compute inline.
+
+Jobs run in a bounded process pool owned by the worker process that
+accepted them, so a job can only be polled through that same process.
+
+A poll with ?wait= holds its web worker until the job finishes or the wait
+runs out. Under the sync gunicorn workers in app.yaml that is the worker's
+only request slot, so waits are capped well below gunicorn's 30 s timeout.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', os.cpu_count() or 1))
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', 16))
+
+# Finished jobs are forgotten this long after they finished
+JOB_TTL_SECONDS = 600
+
+# Longest a poll may block waiting for a job to finish
+MAX_WAIT_SECONDS = 10
+
+class JobQueueFull(Exception):
+    pass
+
+_pool = None
+_jobs = {}
+_finished = {}
+# Reentrant because done-callbacks run inline when a future is already done
+_lock = threading.RLock()
+
+def purge_expired():
+    cutoff = time.monotonic() - JOB_TTL_SECONDS
+    with _lock:
+        for job_id in [i for i, finished in _finished.items() if finished < cutoff]:
+            del _jobs[job_id], _finished[job_id]
+
+def _succeeded(future):
+    return not future.cancelled() and future.exception() is None
+
+def _pool_submit(func, *args):
+    global _pool
+    # Created on first use so that each forked worker gets its own pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+    try:
+        return _pool.submit(func, *args)
+    except BrokenProcessPool:
+        # A pool process died (e.g. OOM-killed). The executor has already
+        # failed the jobs it was running, so start over with a fresh pool
+        _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        return _pool.submit(func, *args)
+
+def submit(func, *args, on_done=None):
+    """Run func(*args) in the pool and return its job id, or raise JobQueueFull.
+
+    on_done, if given, is called in this process with the result of a
+    successful job.
+    """
+    with _lock:
+        purge_expired()
+        if len(_jobs) - len(_finished) >= MAX_PENDING_JOBS:
+            raise JobQueueFull()
+        job_id = uuid.uuid4().hex
+        future = _pool_submit(func, *args)
+
+        def finish(future):
+            with _lock:
+                _finished[job_id] = time.monotonic()
+            if on_done is not None and _succeeded(future):
+                on_done(future.result())
+
+        _jobs[job_id] = future
+        future.add_done_callback(finish)
+        return job_id
+
+def get(job_id, timeout=0):
+    """Return the job's future, waiting up to timeout seconds for it to finish."""
+    with _lock:
+        # Also purged here so results are released even when no jobs are submitted
+        purge_expired()
+        future = _jobs.get(job_id)
+    if future is None:
+        return None
+    if timeout > 0:
+        wait([future], timeout=min(timeout, MAX_WAIT_SECONDS))
+    return future
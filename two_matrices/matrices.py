@@ -0,0 +1,694 @@
+"""Matrix parsing and multiplication for the matrix service.
+
+NumPy is used when it is installed. Without it, matrices stay as lists of
+rows and are multiplied by the cache-blocked pure-Python engine.
+"""
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from operator import mul
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Rows of A and columns of B handled together by the pure-Python engine
+BLOCK_SIZE = 64
+
+ALGORITHMS = ('standard', 'strassen')
+
+# Smallest leaf size accepted from a request, to bound recursion depth
+MIN_STRASSEN_LEAF = 16
+
+# Strassen is only used when padding the operands to a common square size
+# at most multiplies the work of the plain product by this factor
+MAX_STRASSEN_PADDING = 2
+
+MAX_CHAIN_LENGTH = 256
+
+INT64_MAX = 2 ** 63 - 1
+
+# Binary request bodies: concatenated .npy files, or raw buffers described
+# by X-Dtype and X-Shape-A / X-Shape-B headers
+NPY_MIMETYPE = 'application/x-npy'
+RAW_MIMETYPE = 'application/octet-stream'
+
+SPARSE_FORMATS = ('csr', 'coo')
+
+# Products at or below this fraction of non-zeros are returned as CSR
+SPARSE_OUTPUT_DENSITY = 0.25
+
+# Largest dimension of a sparse operand. Row pointers cost 8 bytes per row,
+# and flattened (row, col) keys stay far inside int64
+MAX_SPARSE_DIM = int(os.environ.get('MAX_SPARSE_DIM', 1 << 20))
+
+# Most scalar products one sparse request may expand to. The product can
+# hold one entry per scalar product, at 24 bytes each plus a copy
+MAX_SPARSE_FLOPS = int(os.environ.get('MAX_SPARSE_FLOPS', 1 << 22))
+
+# Scalar products the sparse kernels expand at a time. Each one costs about
+# 100 bytes of temporaries, so this bounds them to a few tens of MB
+SPARSE_CHUNK = 1 << 18
+
+# A sparse scalar product, with its index work and merge, costs about as
+# much as this many dense multiply-adds
+SPARSE_FLOP_COST = 32
+
+# Sparse operands are held as COO triplets in row-major order
+SparseMatrix = namedtuple('SparseMatrix', 'shape rows cols data')
+
+# Total size of products kept by the memoization cache
+PRODUCT_CACHE_BYTES = int(os.environ.get('PRODUCT_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Bytes each cached product costs beyond its elements: the key digests and
+# tuple, the array or list headers and the dictionary node
+CACHE_ENTRY_OVERHEAD = 512
+
+def matrix_shape(rows, name):
+    """Return (rows, columns) of a JSON matrix, or raise ValueError."""
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, list) and row for row in rows):
+        raise ValueError(f"'{name}' must be a non-empty list of non-empty rows.")
+    width = len(rows[0])
+    if any(len(row) != width for row in rows):
+        raise ValueError(f"All rows of '{name}' must have the same length.")
+    return len(rows), width
+
+def to_array(rows, name):
+    if not all(isinstance(x, (int, float)) and not isinstance(x, bool) for row in rows for x in row):
+        raise ValueError(f"'{name}' must contain only numbers.")
+    if np is None:
+        return [list(row) for row in rows]
+    arr = np.array(rows)
+    if arr.dtype.kind not in 'if':
+        raise ValueError(f"'{name}' has integers outside the 64-bit range.")
+    return arr
+
+def to_lists(matrix):
+    return matrix if np is None else matrix.tolist()
+
+def parse_operands(a, b):
+    """Validate two JSON matrices and return them as arrays, or raise ValueError."""
+    # Shapes are checked before any element is converted
+    check_conformable(matrix_shape(a, 'a'), matrix_shape(b, 'b'))
+    return to_array(a, 'a'), to_array(b, 'b')
+
+def check_conformable(a_shape, b_shape):
+    if a_shape[1] != b_shape[0]:
+        raise ValueError(f"Cannot multiply a {a_shape[0]}x{a_shape[1]} matrix "
+                         f"by a {b_shape[0]}x{b_shape[1]} matrix.")
+
+def check_binary_dtype(dtype, name):
+    if dtype.kind not in 'iuf':
+        raise ValueError(f"'{name}' must have an integer or floating-point dtype, not {dtype.str}.")
+
+def read_npy_header(data, offset, name):
+    """Return (shape, fortran_order, dtype, payload offset) of the .npy file at offset."""
+    fp = io.BytesIO(data)
+    fp.seek(offset)
+    readers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+    # NumPy's own parse errors are replaced, as they describe its internals
+    try:
+        version = np.lib.format.read_magic(fp)
+        if version in readers:
+            shape, fortran_order, dtype = readers[version](fp)
+    except ValueError:
+        raise ValueError(f"'{name}' is not a valid .npy array.") from None
+    if version not in readers:
+        raise ValueError(f"'{name}' uses unsupported .npy version {version}.")
+    if len(shape) != 2 or min(shape) < 1:
+        raise ValueError(f"'{name}' must be a non-empty 2-D array.")
+    check_binary_dtype(dtype, name)
+    return shape, fortran_order, dtype, fp.tell()
+
+def view_buffer(data, dtype, shape, offset, name, fortran_order=False):
+    """Wrap part of data as an array without copying it."""
+    count = shape[0] * shape[1]
+    if len(data) < offset + count * dtype.itemsize:
+        raise ValueError(f"The body is too short for '{name}'.")
+    arr = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    if fortran_order:
+        return arr.reshape(shape[::-1]).T
+    return arr.reshape(shape)
+
+def parse_npy_operands(data):
+    """Parse a body of two concatenated .npy files, or raise ValueError."""
+    a_shape, a_fortran, a_dtype, a_offset = read_npy_header(data, 0, 'a')
+    b_start = a_offset + a_shape[0] * a_shape[1] * a_dtype.itemsize
+    b_shape, b_fortran, b_dtype, b_offset = read_npy_header(data, b_start, 'b')
+    check_conformable(a_shape, b_shape)
+    if len(data) != b_offset + b_shape[0] * b_shape[1] * b_dtype.itemsize:
+        raise ValueError("The body must contain exactly two .npy arrays.")
+    return (view_buffer(data, a_dtype, a_shape, a_offset, 'a', a_fortran),
+            view_buffer(data, b_dtype, b_shape, b_offset, 'b', b_fortran))
+
+def parse_binary_shape(value, name):
+    try:
+        rows, cols = (int(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Shape of '{name}' must be given as 'rows,columns'.") from None
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Shape of '{name}' must be positive.")
+    return rows, cols
+
+def parse_raw_operands(data, dtype, a_shape, b_shape):
+    """Parse a raw body holding A's buffer followed by B's, or raise ValueError."""
+    try:
+        dtype = np.dtype(dtype or '')
+    except TypeError:
+        raise ValueError("X-Dtype must name a NumPy dtype such as '<f8' or '<i8'.") from None
+    check_binary_dtype(dtype, 'X-Dtype')
+    a_shape = parse_binary_shape(a_shape, 'a')
+    b_shape = parse_binary_shape(b_shape, 'b')
+    check_conformable(a_shape, b_shape)
+    b_offset = a_shape[0] * a_shape[1] * dtype.itemsize
+    if len(data) != b_offset + b_shape[0] * b_shape[1] * dtype.itemsize:
+        raise ValueError("The body size does not match the given shapes and dtype.")
+    return (view_buffer(data, dtype, a_shape, 0, 'a'),
+            view_buffer(data, dtype, b_shape, b_offset, 'b'))
+
+def encode_binary(matrix, mimetype):
+    """Return (body, headers) for a product in the request's binary form."""
+    if mimetype == NPY_MIMETYPE:
+        buf = io.BytesIO()
+        np.save(buf, matrix)
+        return buf.getvalue(), {}
+    headers = {'X-Dtype': matrix.dtype.str, 'X-Shape': f'{matrix.shape[0]},{matrix.shape[1]}'}
+    return matrix.tobytes(), headers
+
+def parse_chain(items):
+    """Validate a list of JSON matrices to be multiplied in sequence, or raise ValueError."""
+    if not isinstance(items, list) or not 1 <= len(items) <= MAX_CHAIN_LENGTH:
+        raise ValueError(f"'matrices' must be a list of 1 to {MAX_CHAIN_LENGTH} matrices.")
+    shapes = [matrix_shape(rows, chain_name(i)) for i, rows in enumerate(items)]
+    for i in range(1, len(shapes)):
+        if shapes[i - 1][1] != shapes[i][0]:
+            raise ValueError(f"Cannot multiply {chain_name(i - 1)} ({shapes[i - 1][0]}x{shapes[i - 1][1]}) "
+                             f"by {chain_name(i)} ({shapes[i][0]}x{shapes[i][1]}).")
+    return [to_array(rows, chain_name(i)) for i, rows in enumerate(items)]
+
+def chain_name(index):
+    return chr(ord('A') + index) if index < 26 else f'M{index}'
+
+def is_integer(matrix):
+    if np is None:
+        return all(isinstance(x, int) for row in matrix for x in row)
+    return matrix.dtype.kind in 'iu'
+
+def parse_power(a, k, mod):
+    """Validate a square JSON matrix, exponent and optional modulus, or raise ValueError."""
+    rows, cols = matrix_shape(a, 'a')
+    if rows != cols:
+        raise ValueError(f"'a' must be square, not {rows}x{cols}.")
+    if not isinstance(k, int) or isinstance(k, bool) or not 0 <= k <= INT64_MAX:
+        raise ValueError(f"'k' must be an integer from 0 to {INT64_MAX}.")
+    a = to_array(a, 'a')
+    if mod is not None:
+        if not isinstance(mod, int) or isinstance(mod, bool) or mod < 2:
+            raise ValueError("'mod' must be an integer of at least 2.")
+        if not is_integer(a):
+            raise ValueError("'mod' requires 'a' to contain only integers.")
+        # Every product of reduced entries must stay exact in int64
+        if np is not None and rows * (mod - 1) ** 2 > INT64_MAX:
+            raise ValueError(f"'mod' is too large for exact 64-bit products of a {rows}x{rows} matrix.")
+    return a, k, mod
+
+def blocked_matmul(a, b, block=BLOCK_SIZE):
+    """Multiply lists of rows tile by tile against a pre-transposed B.
+
+    Each output entry is a dot product of two contiguous row lists, and a
+    block of B's columns is reused across a block of A's rows before moving on.
+    """
+    bt = [list(col) for col in zip(*b)]
+    product = [[] for _ in a]
+    for j0 in range(0, len(bt), block):
+        cols = bt[j0:j0 + block]
+        for i0 in range(0, len(a), block):
+            for row, out in zip(a[i0:i0 + block], product[i0:i0 + block]):
+                out.extend([sum(map(mul, row, col)) for col in cols])
+    return product
+
+def multiply(a, b):
+    if np is None:
+        return blocked_matmul(a, b)
+    return np.matmul(a, b)
+
+def power_multiplications(k):
+    """Products matrix_power() performs for exponent k."""
+    return max(k.bit_length() + bin(k).count('1') - 2, 0)
+
+def _reduce(matrix, mod):
+    if mod is None:
+        return matrix
+    if np is None:
+        return [[x % mod for x in row] for row in matrix]
+    return matrix % mod
+
+def _largest(matrix):
+    if np is None:
+        return max(abs(x) for row in matrix for x in row)
+    return max(int(matrix.max()), -int(matrix.min()))
+
+def _power_step(x, y, mod):
+    # NumPy integers wrap silently and Python integers grow without bound,
+    # so refuse products that could leave the int64 range
+    if mod is None and is_integer(x) and len(y) * _largest(x) * _largest(y) > INT64_MAX:
+        raise ValueError("Entries of the power overflow 64-bit integers; pass 'mod' to keep them bounded.")
+    return _reduce(multiply(x, y), mod)
+
+def matrix_power(a, k, mod=None):
+    """Raise a square matrix to the kth power by repeated squaring.
+
+    Takes power_multiplications(k) products from multiply(). With mod,
+    entries are reduced after every product.
+    """
+    base = _reduce(a, mod)
+    result = None
+    while k:
+        if k & 1:
+            result = base if result is None else _power_step(result, base, mod)
+        k >>= 1
+        if k:
+            base = _power_step(base, base, mod)
+    if result is not None:
+        return result
+    if np is None:
+        return [[type(a[0][0])(i == j) for j in range(len(a))] for i in range(len(a))]
+    return np.eye(len(a), dtype=a.dtype)
+
+def multiply_batch(pairs):
+    """Multiply many (a, b) pairs with one stacked matmul per distinct shape and dtype."""
+    if np is None:
+        return [multiply(a, b) for a, b in pairs]
+    groups = {}
+    for index, (a, b) in enumerate(pairs):
+        groups.setdefault((a.shape, b.shape, a.dtype, b.dtype), []).append(index)
+    products = [None] * len(pairs)
+    for indices in groups.values():
+        stacked = np.matmul(np.stack([pairs[i][0] for i in indices]),
+                            np.stack([pairs[i][1] for i in indices]))
+        for index, product in zip(indices, stacked):
+            products[index] = product
+    return products
+
+def _quadrants(m, h):
+    if np is not None:
+        return m[:h, :h], m[:h, h:], m[h:, :h], m[h:, h:]
+    top, bottom = m[:h], m[h:]
+    return ([row[:h] for row in top], [row[h:] for row in top],
+            [row[:h] for row in bottom], [row[h:] for row in bottom])
+
+def _add(x, y):
+    if np is not None:
+        return x + y
+    return [[p + q for p, q in zip(r, s)] for r, s in zip(x, y)]
+
+def _sub(x, y):
+    if np is not None:
+        return x - y
+    return [[p - q for p, q in zip(r, s)] for r, s in zip(x, y)]
+
+def _join(c11, c12, c21, c22):
+    if np is not None:
+        return np.block([[c11, c12], [c21, c22]])
+    return [r + s for r, s in zip(c11, c12)] + [r + s for r, s in zip(c21, c22)]
+
+def _pad(m, size):
+    if np is not None:
+        return np.pad(m, ((0, size - m.shape[0]), (0, size - m.shape[1])))
+    return [row + [0] * (size - len(row)) for row in m] + [[0] * size for _ in range(size - len(m))]
+
+def _crop(m, rows, cols):
+    if np is not None:
+        return m[:rows, :cols]
+    return [row[:cols] for row in m[:rows]]
+
+def _strassen_square(a, b, leaf):
+    n = len(a)
+    if n <= leaf:
+        return multiply(a, b)
+    if n % 2:
+        return _crop(_strassen_square(_pad(a, n + 1), _pad(b, n + 1), leaf), n, n)
+
+    h = n // 2
+    a11, a12, a21, a22 = _quadrants(a, h)
+    b11, b12, b21, b22 = _quadrants(b, h)
+    m1 = _strassen_square(_add(a11, a22), _add(b11, b22), leaf)
+    m2 = _strassen_square(_add(a21, a22), b11, leaf)
+    m3 = _strassen_square(a11, _sub(b12, b22), leaf)
+    m4 = _strassen_square(a22, _sub(b21, b11), leaf)
+    m5 = _strassen_square(_add(a11, a12), b22, leaf)
+    m6 = _strassen_square(_sub(a21, a11), _add(b11, b12), leaf)
+    m7 = _strassen_square(_sub(a12, a22), _add(b21, b22), leaf)
+    return _join(_add(_sub(_add(m1, m4), m5), m7), _add(m3, m5),
+                 _add(m2, m4), _add(_add(_sub(m1, m2), m3), m6))
+
+def strassen(a, b, leaf=None):
+    """Multiply with Strassen's algorithm down to leaf-sized blocks.
+
+    Operands are zero-padded to a common square size (and to an even size
+    at every odd level); blocks at or below leaf go to multiply().
+    """
+    rows, cols = len(a), len(b[0])
+    size = max(rows, len(b), cols)
+    product = _strassen_square(_pad(a, size), _pad(b, size), leaf or strassen_leaf)
+    return _crop(product, rows, cols)
+
+def _random_square(n):
+    if np is not None:
+        return np.random.default_rng(0).random((n, n))
+    return [[(i * 7 + j * 13) % 17 / 17 for j in range(n)] for i in range(n)]
+
+def _best_time(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def autotune_strassen_leaf():
+    """Pick the smallest block size at which one Strassen level beats the base engine."""
+    candidates = (128, 256, 512) if np is not None else (16, 32, 64)
+    for leaf in candidates:
+        a, b = _random_square(2 * leaf), _random_square(2 * leaf)
+        if _best_time(_strassen_square, a, b, leaf) < _best_time(multiply, a, b):
+            return leaf
+    # Strassen never won, so only recurse on blocks beyond anything measured
+    return 2 * candidates[-1]
+
+strassen_leaf = int(os.environ.get('STRASSEN_LEAF', 0)) or autotune_strassen_leaf()
+
+def operand_digest(matrix):
+    if np is None:
+        return hashlib.blake2b(repr(matrix).encode(), digest_size=16).digest()
+    matrix = np.ascontiguousarray(matrix)
+    digest = hashlib.blake2b(f'{matrix.dtype.str}{matrix.shape}'.encode(), digest_size=16)
+    digest.update(matrix)
+    return digest.digest()
+
+def product_key(a, b, algorithm='standard', leaf=None):
+    # Keyed by the engine multiply_with() will actually use, so that unused
+    # options do not split entries
+    if algorithm == 'strassen' and uses_strassen(len(a), len(b), len(b[0])):
+        leaf = leaf or strassen_leaf
+    else:
+        algorithm, leaf = 'standard', None
+    return operand_digest(a), operand_digest(b), algorithm, leaf
+
+def product_size(matrix):
+    if np is None:
+        elements = sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in matrix)
+        return CACHE_ENTRY_OVERHEAD + sys.getsizeof(matrix) + elements
+    return CACHE_ENTRY_OVERHEAD + matrix.nbytes
+
+class ProductCache:
+    """LRU cache of products keyed by operand content, bounded by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            product = self._entries.get(key)
+            if product is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return product
+
+    def put(self, key, product):
+        size = product_size(product)
+        if size > self.max_bytes:
+            return
+        if np is not None:
+            # A view (such as a cropped Strassen result) would pin its whole
+            # base array while only the view's bytes are counted
+            if product.base is not None:
+                product = product.copy()
+            product.setflags(write=False)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= product_size(old)
+            self._entries[key] = product
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= product_size(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "bytes": self.size, "max_bytes": self.max_bytes}
+
+product_cache = ProductCache(PRODUCT_CACHE_BYTES)
+
+def parse_algorithm(payload):
+    """Return (algorithm, leaf) from a request payload, or raise ValueError."""
+    algorithm = payload.get('algorithm', 'standard')
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Invalid algorithm. Use one of: {', '.join(ALGORITHMS)}.")
+    leaf = payload.get('leaf_size')
+    if leaf is not None and (not isinstance(leaf, int) or isinstance(leaf, bool)
+                             or leaf < MIN_STRASSEN_LEAF):
+        raise ValueError(f"'leaf_size' must be an integer of at least {MIN_STRASSEN_LEAF}.")
+    return algorithm, leaf
+
+def uses_strassen(rows, inner, cols):
+    return max(rows, inner, cols) ** 3 <= MAX_STRASSEN_PADDING * rows * inner * cols
+
+def strassen_flops(size, leaf):
+    """Scalar multiplications _strassen_square() performs on size x size operands."""
+    if size <= leaf:
+        return size ** 3
+    return 7 * strassen_flops((size + 1) // 2, leaf)
+
+def product_flops(a, b, algorithm='standard', leaf=None):
+    """Scalar multiplications multiply_with() performs for a @ b."""
+    rows, inner, cols = len(a), len(b), len(b[0])
+    if algorithm == 'strassen' and uses_strassen(rows, inner, cols):
+        return strassen_flops(max(rows, inner, cols), leaf or strassen_leaf)
+    return rows * inner * cols
+
+def multiply_with(a, b, algorithm='standard', leaf=None):
+    # Far from square operands would be mostly padding, so they skip Strassen
+    if algorithm == 'strassen' and uses_strassen(len(a), len(b), len(b[0])):
+        return strassen(a, b, leaf)
+    return multiply(a, b)
+
+def chain_order(dims):
+    """Matrix-chain dynamic program over dimensions d0..dn.
+
+    Returns the minimum number of scalar multiplications and the table of
+    split points that achieves it.
+    """
+    n = len(dims) - 1
+    cost = [[0] * n for _ in range(n)]
+    split = [[0] * n for _ in range(n)]
+    for length in range(2, n + 1):
+        for i in range(n - length + 1):
+            j = i + length - 1
+            cost[i][j] = float('inf')
+            for k in range(i, j):
+                c = cost[i][k] + cost[k + 1][j] + dims[i] * dims[k + 1] * dims[j + 1]
+                if c < cost[i][j]:
+                    cost[i][j], split[i][j] = c, k
+    return cost[0][n - 1], split
+
+def chain_dims(matrices):
+    return [len(matrices[0])] + [len(m[0]) for m in matrices]
+
+def multiply_chain(matrices, algorithm='standard', leaf=None, plan=None):
+    """Multiply a chain in its cheapest order.
+
+    plan is chain_order()'s result for the chain, if already computed.
+    Returns (product, order, flops, left_to_right_flops), with costs counted
+    as scalar multiplications.
+    """
+    dims = chain_dims(matrices)
+    flops, split = plan or chain_order(dims)
+    left_to_right = sum(dims[0] * dims[k] * dims[k + 1] for k in range(1, len(matrices)))
+
+    def run(i, j):
+        if i == j:
+            return matrices[i], chain_name(i)
+        left, left_order = run(i, split[i][j])
+        right, right_order = run(split[i][j] + 1, j)
+        return multiply_with(left, right, algorithm, leaf), f'({left_order} {right_order})'
+
+    product, order = run(0, len(matrices) - 1)
+    return product, order, flops, left_to_right
+
+def index_array(values, name):
+    if not isinstance(values, list) or not all(isinstance(x, int) and not isinstance(x, bool)
+                                               for x in values):
+        raise ValueError(f"'{name}' must be a list of integers.")
+    return np.array(values, dtype=np.int64)
+
+def parse_sparse(obj, name):
+    """Convert a JSON CSR or COO matrix into a SparseMatrix, or raise ValueError."""
+    fmt = obj.get('format')
+    if fmt not in SPARSE_FORMATS:
+        raise ValueError(f"'{name}.format' must be one of: {', '.join(SPARSE_FORMATS)}.")
+    shape = obj.get('shape')
+    if (not isinstance(shape, list) or len(shape) != 2
+            or not all(isinstance(x, int) and not isinstance(x, bool) and 0 < x <= MAX_SPARSE_DIM
+                       for x in shape)):
+        raise ValueError(f"'{name}.shape' must be two integers from 1 to {MAX_SPARSE_DIM}.")
+    values = obj.get('data')
+    if not isinstance(values, list) or not all(isinstance(x, (int, float)) and not isinstance(x, bool)
+                                               for x in values):
+        raise ValueError(f"'{name}.data' must be a list of numbers.")
+    data = np.array(values) if values else np.zeros(0, dtype=np.int64)
+    if data.dtype.kind not in 'if':
+        raise ValueError(f"'{name}.data' has integers outside the 64-bit range.")
+
+    if fmt == 'coo':
+        rows = index_array(obj.get('row'), f'{name}.row')
+        cols = index_array(obj.get('col'), f'{name}.col')
+    else:
+        indptr = index_array(obj.get('indptr'), f'{name}.indptr')
+        cols = index_array(obj.get('indices'), f'{name}.indices')
+        if (len(indptr) != shape[0] + 1 or indptr[0] != 0 or indptr[-1] != len(cols)
+                or np.any(np.diff(indptr) < 0)):
+            raise ValueError(f"'{name}.indptr' must rise from 0 to the number of stored values "
+                             f"over {shape[0] + 1} entries.")
+        rows = np.repeat(np.arange(shape[0]), np.diff(indptr))
+    if not len(rows) == len(cols) == len(data):
+        raise ValueError(f"'{name}' must have as many indices as stored values.")
+    if np.any(rows < 0) or np.any(rows >= shape[0]) or np.any(cols < 0) or np.any(cols >= shape[1]):
+        raise ValueError(f"'{name}' has indices outside its shape.")
+
+    order = np.lexsort((cols, rows))
+    return SparseMatrix(tuple(shape), rows[order], cols[order], data[order])
+
+def parse_operand(value, name):
+    """Return a dense array or, for a JSON object, a SparseMatrix."""
+    if isinstance(value, dict):
+        return parse_sparse(value, name)
+    matrix_shape(value, name)
+    return to_array(value, name)
+
+def parse_sparse_operands(a, b):
+    a, b = parse_operand(a, 'a'), parse_operand(b, 'b')
+    check_conformable(a.shape, b.shape)
+    return a, b
+
+def row_pointers(rows, n):
+    return np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n))))
+
+def sum_duplicates(keys, values):
+    """Return the sorted distinct keys and the sum of the values for each."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.zeros(len(keys), dtype=values.dtype)
+    np.add.at(sums, inverse, values)
+    return keys, sums
+
+def expand_products(a, b, b_indptr, counts, entries):
+    """Columns and values of the products of a's entries in the given slice."""
+    cols, counts = a.cols[entries], counts[entries]
+    offsets = np.cumsum(counts) - counts
+    positions = np.repeat(b_indptr[cols] - offsets, counts) + np.arange(int(counts.sum()))
+    return b.cols[positions], np.repeat(a.data[entries], counts) * b.data[positions]
+
+def runs(work, limit):
+    """Split 0..len(work) into consecutive slices of about limit total work each."""
+    ends = np.cumsum(work)
+    start = 0
+    while start < len(work):
+        stop = int(np.searchsorted(ends, ends[start] - work[start] + limit, side='right'))
+        yield slice(start, max(stop, start + 1))
+        start = max(stop, start + 1)
+
+def sparse_times_sparse(a, b):
+    # Row-by-row (Gustavson) expansion, vectorized: each stored a[i, k] is
+    # paired with every stored entry of row k of b. Rows are expanded in
+    # groups worth about SPARSE_CHUNK products to bound the temporaries
+    b_indptr = row_pointers(b.rows, b.shape[0])
+    a_indptr = row_pointers(a.rows, a.shape[0])
+    counts = b_indptr[a.cols + 1] - b_indptr[a.cols]
+    row_work = np.bincount(a.rows, weights=counts, minlength=a.shape[0]).astype(np.int64)
+    dtype = np.result_type(a.data, b.data)
+    parts = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=dtype))]
+    for group in runs(row_work, SPARSE_CHUNK):
+        entries = slice(a_indptr[group.start], a_indptr[group.stop])
+        if group.stop - group.start == 1 and row_work[group.start] > SPARSE_CHUNK:
+            # One row too heavy to expand at once is summed into a dense row
+            row = np.zeros(b.shape[1], dtype=dtype)
+            for run in runs(counts[entries], SPARSE_CHUNK):
+                run = slice(entries.start + run.start, entries.start + run.stop)
+                cols, values = expand_products(a, b, b_indptr, counts, run)
+                np.add.at(row, cols, values)
+            cols = np.flatnonzero(row)
+            parts.append((np.full(len(cols), group.start), cols, row[cols]))
+            continue
+        cols, values = expand_products(a, b, b_indptr, counts, entries)
+        rows = np.repeat(a.rows[entries], counts[entries])
+        # Both dimensions are at most MAX_SPARSE_DIM, so the flattened key cannot overflow
+        keys, data = sum_duplicates(rows * b.shape[1] + cols, values)
+        nonzero = data != 0
+        keys, data = keys[nonzero], data[nonzero]
+        parts.append((keys // b.shape[1], keys % b.shape[1], data))
+
+    rows, cols, data = (np.concatenate(arrays) for arrays in zip(*parts))
+    return SparseMatrix((a.shape[0], b.shape[1]), rows, cols, data)
+
+def sparse_times_dense(a, b):
+    product = np.zeros((a.shape[0], b.shape[1]), dtype=np.result_type(a.data, b))
+    step = max(SPARSE_CHUNK // b.shape[1], 1)
+    for start in range(0, len(a.data), step):
+        chunk = slice(start, start + step)
+        np.add.at(product, a.rows[chunk], a.data[chunk, None] * b[a.cols[chunk]])
+    return product
+
+def dense_times_sparse(a, b):
+    product = np.zeros((a.shape[0], b.shape[1]), dtype=np.result_type(a, b.data))
+    step = max(SPARSE_CHUNK // a.shape[0], 1)
+    for start in range(0, len(b.data), step):
+        chunk = slice(start, start + step)
+        np.add.at(product.T, b.cols[chunk], (a[:, b.rows[chunk]] * b.data[chunk]).T)
+    return product
+
+def sparse_flops(a, b):
+    """Scalar multiplications multiply_sparse() performs."""
+    if isinstance(a, SparseMatrix) and isinstance(b, SparseMatrix):
+        return int(np.bincount(b.rows, minlength=b.shape[0])[a.cols].sum())
+    if isinstance(a, SparseMatrix):
+        return len(a.data) * b.shape[1]
+    return a.shape[0] * len(b.data)
+
+def multiply_sparse(a, b):
+    """Multiply when either operand is sparse, returning whichever form suits the result's density."""
+    if isinstance(a, SparseMatrix) and isinstance(b, SparseMatrix):
+        product = sparse_times_sparse(a, b)
+        if len(product.data) <= SPARSE_OUTPUT_DENSITY * product.shape[0] * product.shape[1]:
+            return product
+        dense = np.zeros(product.shape, dtype=product.data.dtype)
+        dense[product.rows, product.cols] = product.data
+        return dense
+
+    product = sparse_times_dense(a, b) if isinstance(a, SparseMatrix) else dense_times_sparse(a, b)
+    if np.count_nonzero(product) <= SPARSE_OUTPUT_DENSITY * product.size:
+        rows, cols = np.nonzero(product)
+        return SparseMatrix(product.shape, rows, cols, product[rows, cols])
+    return product
+
+def sparse_to_json(matrix):
+    return {
+        "format": "csr",
+        "shape": list(matrix.shape),
+        "data": matrix.data.tolist(),
+        "indices": matrix.cols.tolist(),
+        "indptr": row_pointers(matrix.rows, matrix.shape[0]).tolist(),
+    }